@@ -1,84 +1,166 @@
-import random
-
 from matplotlib import pyplot as plt
 
+import numba
+import numpy as np
 from numpy import array_equal
 
-def lookup_table(rule_number):
+def rule_table(rule_number):
     """
-    Returns a dictionary which maps ECA neighborhoods to output values. 
-    Uses Wolfram rule number convention.
-    
+    Returns the lookup table for the given rule number as a flat numpy array
+    indexed by 3*left + center. Uses Wolfram rule number convention.
+
     Parameters
     ----------
     rule_number: int
-        Integer value between 0 and 255, inclusive. Specifies the ECA lookup table
+        Integer value between 0 and 19682, inclusive. Specifies the CA lookup table
         according to the Wolfram numbering scheme.
-        
+
     Returns
     -------
-    lookup_table: dict
-        Lookup table dictionary that maps neighborhood tuples to their output according to the 
-        ECA local evolution rule (i.e. the lookup table), as specified by the rule number. 
+    rule_table: ndarray
+        Length-9 array of np.uint8 rule outputs, indexed by 3*left + center.
+        Index k corresponds to the neighborhood (k//3, k%3).
     """
-    
+
     if not isinstance(rule_number, int) or rule_number < 0 or rule_number > 19682:
         raise ValueError("rule_number must be an int between 0 and 19682, inclusive")
-        
-    neighborhoods = [(0,0),(0,1),(0,2),(1,0),(1,1),(1,2),(2,0),(2,1),(2,2)]
+
+    table = np.empty(9, dtype=np.uint8)
     n = rule_number
-    nums = []
-    
-    while n:
-        n, r = divmod(n, 3)
-        nums.append(str(r))
-        
-    in_ternary = ''.join(reversed(nums))
-    ternary_length = len(in_ternary)
-    
-    if ternary_length != 9:
-        padding = 9 - ternary_length
-        in_ternary = '0'*padding + in_ternary
 
-    return dict(zip(neighborhoods, map(int, reversed(in_ternary))))
+    # digit k of the ternary expansion is the output for index 3*left + center == k
+    for k in range(9):
+        n, table[k] = divmod(n, 3)
+
+    return table
+
+@numba.njit(numba.uint8[:, :](numba.uint8[:], numba.uint8[:], numba.int64), cache=True)
+def _evolve(rule_flat, initial, time_steps):
+    """
+    Jitted evolution kernel. Fills a preallocated (time_steps+1, length)
+    uint8 field row by row, applying the flat rule table cell by cell.
+
+    Parameters
+    ----------
+    rule_flat: ndarray
+        Length-9 array of np.uint8 rule outputs, indexed by 3*left + center.
+    initial: ndarray
+        1D np.uint8 array giving the initial configuration.
+    time_steps: int
+        Positive integer specifying the number of time steps for evolving the CA.
+
+    Returns
+    -------
+    field: ndarray
+        2D np.uint8 array of the spacetime field, with the initial
+        configuration in row 0.
+    """
+
+    length = initial.shape[0]
+    field = np.empty((time_steps + 1, length), dtype=np.uint8)
+    field[0] = initial
+
+    # nothing to evolve, and the boundary write below would be out of bounds
+    if length == 0:
+        return field
+
+    for t in range(time_steps):
+        cur = field[t]
+        new = field[t+1]
+
+        # handle the periodic boundary at i == 0 separately so the inner
+        # loop needs no modulo
+        new[0] = rule_flat[3*cur[length - 1] + cur[0]]
+
+        for i in range(1, length):
+            new[i] = rule_flat[3*cur[i-1] + cur[i]]
+
+    return field
+
+def compile_rule(rule_number):
+    """
+    Returns an evolution function specialized to the given rule number. The
+    rule table is captured as a compile-time constant of the jitted code
+    rather than passed as an argument, so LLVM can specialize the lookup for
+    this one rule. Worth it when evolving the same rule many times; the
+    specialized function is recompiled per rule and is not disk-cached.
+
+    Parameters
+    ----------
+    rule_number: int
+        Integer value between 0 and 19682, inclusive. Specifies the CA lookup table
+        according to the Wolfram numbering scheme.
+
+    Returns
+    -------
+    evolve: callable
+        evolve(initial, time_steps) takes a 1D np.uint8 initial configuration
+        and returns the 2D np.uint8 spacetime field, like _evolve with the
+        rule baked in.
+    """
+
+    table = rule_table(rule_number)
+
+    @numba.njit
+    def evolve(initial, time_steps):
+        length = initial.shape[0]
+        field = np.empty((time_steps + 1, length), dtype=np.uint8)
+        field[0] = initial
+
+        for t in range(time_steps):
+            cur = field[t]
+            new = field[t+1]
+
+            new[0] = table[3*cur[length - 1] + cur[0]]
+
+            for i in range(1, length):
+                new[i] = table[3*cur[i-1] + cur[i]]
+
+        return field
+
+    return evolve
 
 def unit_seed(margin_length):
     """
-    Returns a list of a single '1' bounded by margin_length number of '0's 
-    on either side. 
-    
+    Returns a np.uint8 array of a single '1' bounded by margin_length number
+    of '0's on either side.
+
     Parameters
     ----------
     margin_length: int
-        Number of zeros bounding the central one on either side. 
-        
+        Number of zeros bounding the central one on either side.
+
     Returns
     -------
-    out: list
-        [0,]*margin_length + [1,] + [0,]*margin_length
+    out: ndarray
+        1D np.uint8 array of 2*margin_length + 1 zeros, with the central
+        value set to one.
     """
-    
+
     if not isinstance(margin_length, int) or margin_length < 0:
         raise ValueError("margin_length must be a postive int")
-    
-    return [0,]* margin_length + [1,] + [0,]*margin_length
+
+    seed = np.zeros(2*margin_length + 1, dtype=np.uint8)
+    seed[margin_length] = 1
+
+    return seed
 
 def random_string(length):
     """
-    Returns a list of 0s, 1s and 2s
-    
+    Returns a np.uint8 array of 0s, 1s and 2s
+
     Parameters
     ----------
     length: int
-        Number of values in list
-        
+        Number of values in array
+
     Returns
     -------
-    out: list
+    out: ndarray
+        1D np.uint8 array of values drawn uniformly from {0, 1, 2}.
     """
-    initial_condition = [random.randint(0,2) for _ in range(length)]
 
-    return initial_condition
+    return np.random.randint(0, 3, length, dtype=np.uint8)
 
 def spacetime_field(rule_number, initial_condition, time_steps):
     """
@@ -88,13 +170,18 @@ def spacetime_field(rule_number, initial_condition, time_steps):
     Parameters
     ----------
     rule_number: int
-        Integer value between 0 and 255, inclusive. Specifies the ECA lookup table
+        Integer value between 0 and 19682, inclusive. Specifies the CA lookup table
         according to the Wolfram numbering scheme.
-    initial_condition: list
-        Binary string used as the initial condition for the ECA. Elements of the list
-        should be ints. 
+    initial_condition: array-like
+        Initial condition for the CA. Elements should be 0s, 1s and 2s.
     time_steps: int
-        Positive integer specifying the number of time steps for evolving the ECA. 
+        Positive integer specifying the number of time steps for evolving the CA.
+
+    Returns
+    -------
+    field: ndarray
+        2D np.uint8 array of the spacetime field, with the initial
+        configuration in row 0.
     """
     
     if time_steps < 0:
@@ -107,34 +194,84 @@ def spacetime_field(rule_number, initial_condition, time_steps):
     except ValueError:
         raise ValueError("time_steps must be a non-negative integer")
         
-    # we will see a cleaner and more efficient way to do the following when we introduce numpy
-    for i in initial_condition:
-        if i not in [0,1,2]:
-            raise ValueError("initial condition must be a list of 0s, 1s and 2s")
-        
-    lookup = lookup_table(rule_number)
-    length = len(initial_condition)
-    
-    # initialize spacetime field and current configuration
-    spacetime_field = [initial_condition]
-    current_configuration = initial_condition.copy()
+    if not np.isin(initial_condition, (0, 1, 2)).all():
+        raise ValueError("initial condition must be a list of 0s, 1s and 2s")
 
-    # apply the lookup table to evolve the CA for the given number of time steps
-    
-    for t in range(time_steps):
-        new_configuration = []
-        
-        for i in range(length):
+    return _evolve(rule_table(rule_number), np.asarray(initial_condition, dtype=np.uint8), time_steps)
 
-            neighborhood = (current_configuration[(i-1)%length], 
-                            current_configuration[i])
+@numba.njit(numba.uint8[:, :, :](numba.uint8[:], numba.uint8[:, :], numba.int64),
+            parallel=True, cache=True)
+def _evolve_batch(rule_flat, initials, time_steps):
+    """
+    Jitted batch evolution kernel. Evolves each row of initials as an
+    independent run, in parallel across cores; see _evolve for the
+    single-run kernel.
 
-            new_configuration.append(lookup[neighborhood])
+    Parameters
+    ----------
+    rule_flat: ndarray
+        Length-9 array of np.uint8 rule outputs, indexed by 3*left + center.
+    initials: ndarray
+        2D np.uint8 array with one initial configuration per row.
+    time_steps: int
+        Positive integer specifying the number of time steps for evolving the CA.
 
-        current_configuration = new_configuration
-        spacetime_field.append(new_configuration)
-    
-    return spacetime_field
+    Returns
+    -------
+    fields: ndarray
+        3D np.uint8 array of spacetime fields, one per row of initials.
+    """
+
+    runs = initials.shape[0]
+    length = initials.shape[1]
+    fields = np.empty((runs, time_steps + 1, length), dtype=np.uint8)
+
+    for r in numba.prange(runs):
+        fields[r] = _evolve(rule_flat, initials[r], time_steps)
+
+    return fields
+
+def spacetime_fields(rule_number, initial_conditions, time_steps):
+    """
+    Returns a stack of spacetime fields, evolving each of the given initial
+    conditions with the given rule number for the given number of time steps.
+    The runs are independent and are evolved in parallel across cores, so
+    this is the fast way to produce diagrams for many initial conditions.
+
+    Parameters
+    ----------
+    rule_number: int
+        Integer value between 0 and 19682, inclusive. Specifies the CA lookup table
+        according to the Wolfram numbering scheme.
+    initial_conditions: array-like (2D)
+        One initial condition per row, all of the same length. Elements
+        should be 0s, 1s and 2s.
+    time_steps: int
+        Positive integer specifying the number of time steps for evolving the CA.
+
+    Returns
+    -------
+    fields: ndarray
+        3D np.uint8 array; fields[r] is the spacetime field for
+        initial_conditions[r].
+    """
+
+    if time_steps < 0:
+        raise ValueError("time_steps must be a non-negative integer")
+
+    # try converting time_steps to int and raise a custom error if this can't be done
+    try:
+        time_steps = int(time_steps)
+
+    except ValueError:
+        raise ValueError("time_steps must be a non-negative integer")
+
+    if not np.isin(initial_conditions, (0, 1, 2)).all():
+        raise ValueError("initial conditions must contain only 0s, 1s and 2s")
+
+    initials = np.asarray(initial_conditions, dtype=np.uint8)
+
+    return _evolve_batch(rule_table(rule_number), initials, time_steps)
 
 def spacetime_diagram(
         spacetime_field, size=12, colors=plt.cm.Greys):
@@ -153,38 +290,34 @@ def spacetime_diagram(
         See https://matplotlib.org/tutorials/colors/colormaps.html for colormap choices.
         A colormap 'cmap' is called as: colors=plt.cm.cmap
     """
-    plt.figure(figsize=(size,size))
+    # reuse one named figure across calls instead of allocating a new one each time
+    fig = plt.figure("spacetime diagram", clear=True)
+    fig.set_size_inches(size, size)
     plt.imshow(spacetime_field, cmap=colors, interpolation='nearest')
     plt.show()
 
-def test_lookup_table255():
-    lt = lookup_table(255)
-    expected_outputs = [0, 1, 1, 0, 0, 1, 0, 0, 0] # outputs in lexicographical order
-    
-    for neighborhood, expected_out in zip(neighborhoods, expected_outputs):
-        assert lt[neighborhood] == expected_out,\
-        "neighborhood {} gives wrong output!".format(neighborhood)
-        
+def test_rule_table255():
+    table = rule_table(255)
+    expected_outputs = [0, 1, 1, 0, 0, 1, 0, 0, 0] # outputs indexed by 3*left + center
+
+    assert array_equal(table, expected_outputs), "rule 255 gives wrong outputs!"
+
     print("all outputs look good!") # remove if using testing framework like nose
 
-def test_lookup_table9841():
-    lt = lookup_table(9841)
-    expected_outputs = [1, 1, 1, 1, 1, 1, 1, 1, 1] # outputs in lexicographical order
-    
-    for neighborhood, expected_out in zip(neighborhoods, expected_outputs):
-        assert lt[neighborhood] == expected_out,\
-        "neighborhood {} gives wrong output!".format(neighborhood)
-        
+def test_rule_table9841():
+    table = rule_table(9841)
+    expected_outputs = [1, 1, 1, 1, 1, 1, 1, 1, 1] # outputs indexed by 3*left + center
+
+    assert array_equal(table, expected_outputs), "rule 9841 gives wrong outputs!"
+
     print("all outputs look good!") # remove if using testing framework like nose
 
-def test_lookup_table19682():
-    lt = lookup_table(19682)
-    expected_outputs = [2, 2, 2, 2, 2, 2, 2, 2, 2] # outputs in lexicographical order
-    
-    for neighborhood, expected_out in zip(neighborhoods, expected_outputs):
-        assert lt[neighborhood] == expected_out,\
-        "neighborhood {} gives wrong output!".format(neighborhood)
-        
+def test_rule_table19682():
+    table = rule_table(19682)
+    expected_outputs = [2, 2, 2, 2, 2, 2, 2, 2, 2] # outputs indexed by 3*left + center
+
+    assert array_equal(table, expected_outputs), "rule 19682 gives wrong outputs!"
+
     print("all outputs look good!") # remove if using testing framework like nose
 
 def test_spacetime0():
@@ -208,7 +341,26 @@ def test_spacetime22():
     "time step 2 is incorrect"
     print('both time steps give correct output') # remove if using testing framework like nose
 
-    
+def test_spacetime_fields110():
+    initials = [random_string(20) for _ in range(5)]
+    obs_fields = spacetime_fields(110, initials, 20)
+
+    for run, initial in enumerate(initials):
+        assert array_equal(obs_fields[run], spacetime_field(110, initial, 20)), \
+        "field for run {} not correct".format(run)
+
+    print('All fields correct!') # remove if using testing framework like nose
+
+def test_compile_rule110():
+    initial = random_string(20)
+    evolve = compile_rule(110)
+
+    assert array_equal(evolve(initial, 20), spacetime_field(110, initial, 20)), \
+    "specialized evolution does not match spacetime_field"
+
+    print('specialized kernel matches!') # remove if using testing framework like nose
+
+
 class ECA(object):
     """
     Elementary cellular automata simulator.
@@ -220,34 +372,30 @@ class ECA(object):
         Parameters
         ----------
         rule_number: int
-            Integer value between 0 and 255, inclusive. Specifies the ECA lookup table
+            Integer value between 0 and 19682, inclusive. Specifies the CA lookup table
             according to the Wolfram numbering scheme.
-        initial_condition: list
-            Binary string used as the initial condition for the ECA. Elements of the list
-            should be ints. 
-        
+        initial_condition: array-like
+            Initial condition for the CA. Elements should be 0s, 1s and 2s.
+
         Attributes
         ----------
-        lookup_table: dict
-            Lookup table for the ECA given as a dictionary, with neighborhood tuple keys. 
-        initial: array_like
-            Copy of the initial conditions used to instantiate the simulator
-        spacetime: array_like
-            2D array (list of lists) of the spacetime field created by the simulator.
-        current_configuration: array_like
-            List of the spatial configuration of the ECA at the current time
+        rule_table: ndarray
+            Lookup table for the ECA as a flat length-9 array of np.uint8
+            outputs, indexed by 3*left + center.
+        initial: ndarray
+            np.uint8 copy of the initial conditions used to instantiate the simulator
+        spacetime: ndarray
+            2D numpy array of the spacetime field created by the simulator.
+        current_configuration: ndarray
+            Spatial configuration of the ECA at the current time
         """
-        # we will see a cleaner and more efficient way to do the following when we introduce numpy
-        
-        for i in initial_condition:
-            if i not in [0,1,2]:
-                raise ValueError("initial condition must be a list of 0s, 1s and 2s")
-                
-        self.lookup_table = lookup_table(rule_number)
-        self.initial = initial_condition
-        self.spacetime = [initial_condition]
-        self.current_configuration = initial_condition.copy()
-        self._length = len(initial_condition)
+        if not np.isin(initial_condition, (0, 1, 2)).all():
+            raise ValueError("initial condition must be a list of 0s, 1s and 2s")
+
+        self.rule_table = rule_table(rule_number)
+        self.spacetime = np.array([initial_condition], dtype=np.uint8)
+        self.initial = self.spacetime[0].copy()
+        self.current_configuration = self.spacetime[0]
 
     def evolve(self, time_steps):
         """
@@ -269,18 +417,15 @@ class ECA(object):
         except ValueError:
             raise ValueError("time_steps must be a non-negative integer")
 
-        for _ in range(time_steps): # use underscore if the index will not be used
-            new_configuration = []
-            
-            for i in range(self._length):
-
-                neighborhood = (self.current_configuration[(i-1)%self._length], 
-                                self.current_configuration[i])
+        field = _evolve(self.rule_table, self.current_configuration, time_steps)
 
-                new_configuration.append(self.lookup_table[neighborhood])
+        self.current_configuration = field[-1]
 
-            self.current_configuration = new_configuration
-            self.spacetime.append(new_configuration)
+        if len(self.spacetime) == 1:
+            # first call: the field already starts with the initial configuration
+            self.spacetime = field
+        else:
+            self.spacetime = np.concatenate((self.spacetime, field[1:]))
 
 rule_110 = ECA(110, random_string(100))
 rule_110.evolve(50)